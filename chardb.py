@@ -0,0 +1,85 @@
+import os
+import json
+import mmap
+import struct
+import unicodedata
+
+# Precompiled kanji lookup table used by util.isKanji, built by running this file directly (see release.sh).
+# It replaces a unicodedata.name call and a regex match per character with a single byte read.
+# Layout of chardb.bin, integers are little endian:
+#   header   magic, version, metadata length, classes offset
+#   metadata json {"unidata_version"}
+#   classes  one class byte per codepoint
+
+MAGIC = b"KGDB"
+VERSION = 3
+CODEPOINTS = 0x110000
+
+header_struct = struct.Struct("<4sHII")
+
+CLASS_UNKNOWN = 0
+CLASS_UNIFIED = 1
+CLASS_COMPATIBILITY = 2
+CLASS_OTHER = 3
+
+kanji_classes = (CLASS_UNIFIED, CLASS_COMPATIBILITY)
+
+class_prefixes = {
+    CLASS_UNIFIED: "CJK UNIFIED IDEOGRAPH",
+    CLASS_COMPATIBILITY: "CJK COMPATIBILITY IDEOGRAPH",
+}
+
+db_path = os.path.dirname(__file__) + "/chardb.bin"
+
+def classify(char):
+    unicode_name = unicodedata.name(char, "")
+    for char_class, prefix in class_prefixes.items():
+        if unicode_name.startswith(prefix):
+            return char_class
+    return CLASS_OTHER if unicode_name else CLASS_UNKNOWN
+
+def version_tuple(version):
+    return tuple(int(part) for part in version.split("."))
+
+def build(path = db_path):
+    classes = bytes(classify(chr(codepoint)) for codepoint in range(CODEPOINTS))
+    metadata = json.dumps({"unidata_version": unicodedata.unidata_version}).encode("utf-8")
+    classes_offset = header_struct.size + len(metadata)
+    with open(path, "wb") as fileOut:
+        fileOut.write(header_struct.pack(MAGIC, VERSION, len(metadata), classes_offset))
+        fileOut.write(metadata)
+        fileOut.write(classes)
+    return unicodedata.unidata_version, sum(1 for char_class in classes if char_class in kanji_classes)
+
+class CharDB:
+    def __init__(self, path):
+        with open(path, "rb") as file:
+            self.mm = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, metadata_length, classes_offset = header_struct.unpack_from(self.mm)
+        if magic != MAGIC or version != VERSION or len(self.mm) < classes_offset + CODEPOINTS:
+            self.mm.close()
+            raise ValueError("Unsupported character database: %s" % path)
+        metadata = json.loads(self.mm[header_struct.size:header_struct.size + metadata_length].decode("utf-8"))
+        # codepoints added after the build's unicode version are CLASS_UNKNOWN and fall back to unicodedata,
+        # but a build newer than the running python would classify characters that python does not know yet
+        if version_tuple(metadata["unidata_version"]) > version_tuple(unicodedata.unidata_version):
+            self.mm.close()
+            raise ValueError("Character database built for unicode %s" % metadata["unidata_version"])
+        self.classes = memoryview(self.mm)[classes_offset:classes_offset + CODEPOINTS]
+
+db = None
+db_loaded = False
+
+def get_db():
+    global db, db_loaded
+    if not db_loaded:
+        db_loaded = True
+        try:
+            db = CharDB(db_path)
+        except (OSError, ValueError, KeyError, struct.error):
+            db = None
+    return db
+
+if __name__ == "__main__":
+    unidata_version, kanji_count = build()
+    print("Wrote %s: unicode %s, %d kanji" % (db_path, unidata_version, kanji_count))
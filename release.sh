@@ -1 +1,3 @@
-zip kanjigrid_kuuuube_0.0.0.zip *.py config.json data/*
\ No newline at end of file
+# chardb.bin is the kanji lookup table used by util.isKanji
+python3 chardb.py
+zip kanjigrid_kuuuube_0.0.0.zip *.py config.json chardb.bin data/*
\ No newline at end of file
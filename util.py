@@ -3,7 +3,7 @@ import unicodedata
 import collections
 import enum
 
-from . import data
+from . import chardb, data
 
 unit_tuple = collections.namedtuple("unit", "idx value avg_interval count")
 
@@ -23,6 +23,11 @@ class SortOrder(enum.Enum):
 
 cjk_re = re.compile("CJK (UNIFIED|COMPATIBILITY) IDEOGRAPH")
 def isKanji(unichar):
+    db = chardb.get_db()
+    if db is not None and len(unichar) == 1:
+        char_class = db.classes[ord(unichar)]
+        if char_class != chardb.CLASS_UNKNOWN:
+            return char_class in chardb.kanji_classes
     return bool(cjk_re.match(safe_unicodedata_name(unichar)))
 
 def scoreAdjust(score):